@@ -0,0 +1,21 @@
+# The app is one script with spaces in its name, so tests load it by path instead of importing it
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Gamified Assessment Generator.py")
+
+def load_app():
+    module = sys.modules.get("pixelprompt")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("pixelprompt", SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["pixelprompt"] = module
+        spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope="session")
+def pp():
+    return load_app()
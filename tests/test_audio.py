@@ -0,0 +1,87 @@
+from array import array
+
+import pytest
+
+RATE = 8000
+
+# Buffers are NumPy int16 arrays or array("h") depending on the install; these tests only use
+# what both have (len, indexing, iteration, tobytes) so they run either way
+
+def constant(pp, n, value):
+    if pp.HAS_NUMPY:
+        return pp.np.full(n, value, dtype=pp.np.int16)
+    return array("h", [value]) * n
+
+def test_notes_are_rendered_once(pp):
+    bank = pp.ToneBank(RATE, volume=0.5)
+    note = bank.note(440, 100)
+    assert bank.note(440, 100) is note
+    assert len(note) == RATE * 100 // 1000
+    assert len(note.tobytes()) == 2 * len(note) # int16
+    assert note[0] == 0 and abs(int(note[-1])) <= 1 # Faded in and out, no click
+    assert 0.99 * 0.5 * 32767 <= max(abs(int(v)) for v in note) <= 0.5 * 32767
+
+def test_jingles_and_phrases(pp):
+    bank = pp.ToneBank(RATE)
+    notes = ((440, 100), (554, 100), (659, 200))
+    jingle = bank.jingle(notes)
+    assert bank.jingle(notes) is jingle
+    assert jingle.tobytes() == b"".join(bank.note(f, ms).tobytes() for f, ms in notes)
+
+    phrase = bank.phrase((523, 200, 100))
+    assert len(phrase) == RATE * 300 // 1000
+    assert not any(phrase[RATE * 200 // 1000:]) # The rest is silent
+    assert bank.phrase((523, 200, 0)) is bank.note(523, 200)
+    assert bank.phrase(None) is None
+
+def test_music_runs_on_across_blocks(pp):
+    bank = pp.ToneBank(RATE)
+    mixer = pp.PcmMixer(bank)
+    phrase = bank.phrase((523, 200, 100)).tobytes()
+    blocks = [mixer.next_block(lambda: bank.phrase((523, 200, 100))) for _ in range(20)] # 400ms, the phrase is 300ms
+    assert all(len(b) == RATE * mixer.BLOCK_MS // 1000 for b in blocks)
+    stream = b"".join(b.tobytes() for b in blocks)
+    assert stream[:len(phrase)] == phrase
+    assert stream[len(phrase):] == phrase[:len(stream) - len(phrase)] # Next one starts right after
+
+def test_silence_when_nothing_plays(pp):
+    mixer = pp.PcmMixer(pp.ToneBank(RATE))
+    assert not any(mixer.next_block(lambda: None))
+    assert not mixer.active()
+
+def test_sfx_mix_over_music_and_clip(pp):
+    bank = pp.ToneBank(RATE)
+    mixer = pp.PcmMixer(bank)
+    loud, inverted = constant(pp, RATE // 10, 20000), constant(pp, RATE // 10, -20000)
+    mixer.add(loud)
+    mixer.add(inverted)
+    mixer.add(loud)
+    block = mixer.next_block(lambda: loud)
+    assert len(block.tobytes()) == 2 * len(block)
+    assert all(v == 32767 for v in block) # 40000 clipped, not wrapped round to negative
+    assert mixer.active()
+    while mixer.voices: mixer.next_block(lambda: None)
+    assert not mixer.active()
+
+def test_render_without_numpy_is_identical(pp, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(pp, "HAS_NUMPY", True)
+    with_numpy = pp.render_audio(None, seconds=2, rate=RATE).data()
+    monkeypatch.setattr(pp, "HAS_NUMPY", False)
+    pure = pp.render_audio(None, seconds=2, rate=RATE).data()
+    assert len(pure) == 2 * 2 * RATE
+    assert pure == with_numpy
+
+def test_dead_device_does_not_kill_the_audio_thread(pp, monkeypatch):
+    class DeadSink(pp.BufferSink):
+        def write(self, block):
+            raise BrokenPipeError(32, "Broken pipe") # aplay went away
+    monkeypatch.setattr(pp, "HAS_AUDIO", False)
+    engine = pp.AudioEngine(output=DeadSink(RATE))
+    engine.start()
+    engine.play_sfx("START")
+    engine.join(2)
+    assert not engine.is_alive()
+    assert engine.output is None # Went quiet instead of crashing
+    engine.play_sfx("WIN")
+    assert engine.sfx_queue.empty()
@@ -0,0 +1,65 @@
+import threading
+import time
+
+def fast_limiter(pp, per_second=5):
+    # Same limiter, but the request bucket refills in fractions of a second instead of a minute
+    limiter = pp.RateLimiter(rpm=10, tpm=0, rpd=0, tpd=0)
+    limiter.buckets["rpm"] = pp.TokenBucket(1, 1 / per_second)
+    return limiter
+
+def test_interactive_goes_before_batch(pp):
+    limiter = fast_limiter(pp)
+    assert limiter.acquire(10) # Bucket is empty now
+    order = []
+    def call(name, priority):
+        limiter.acquire(10, priority)
+        order.append(name)
+    batch = threading.Thread(target=call, args=("batch", pp.RateLimiter.BATCH))
+    batch.start()
+    time.sleep(0.05) # Batch is queued first...
+    interactive = threading.Thread(target=call, args=("interactive", pp.RateLimiter.INTERACTIVE))
+    interactive.start()
+    batch.join(2)
+    interactive.join(2)
+    assert order == ["interactive", "batch"] # ...but interactive still goes first
+
+def test_timeout_charges_nothing(pp):
+    limiter = pp.RateLimiter(rpm=1, tpm=1000, rpd=100, tpd=0)
+    assert limiter.acquire(100)
+    t0 = time.monotonic()
+    assert not limiter.acquire(100, timeout=0.05)
+    assert 0.05 <= time.monotonic() - t0 < 1
+    status = limiter.status()
+    assert status["queued"] == 0
+    assert status["tpm_left"] == 900 and status["rpd_left"] == 99
+
+def test_throttle_pauses_everyone_and_halves_the_rate(pp):
+    limiter = pp.RateLimiter(rpm=10, tpm=0, rpd=0, tpd=0)
+    assert limiter.throttled(retry_after=0.2) == 0.2
+    assert limiter.status()["throttled"]
+    assert limiter.buckets["rpm"].scale == 0.5
+    t0 = time.monotonic()
+    assert limiter.acquire(10)
+    assert time.monotonic() - t0 >= 0.2
+
+    limiter.succeeded()
+    assert limiter.buckets["rpm"].scale == 0.6
+
+def test_speculative_only_uses_spare_budget(pp):
+    limiter = pp.RateLimiter(rpm=4, tpm=0, rpd=100, tpd=0)
+    assert limiter.acquire(10, pp.RateLimiter.SPECULATIVE) # 4 left, needs 1 + 4 // 2
+    assert limiter.acquire(10)
+    t0 = time.monotonic()
+    assert not limiter.acquire(10, pp.RateLimiter.SPECULATIVE, timeout=5) # 2 left: never waits
+    assert time.monotonic() - t0 < 0.05
+    assert limiter.acquire(10, timeout=0) # The real request still gets one
+    assert limiter.status()["rpd_left"] == 97
+
+def test_limits_from_env(pp, monkeypatch, capsys):
+    monkeypatch.setenv("PIXELPROMPT_GEMINI_LIMITS", "rpm=3,tpd=500,bogus=1,rpd=x")
+    limiter = pp.RateLimiter.from_env()
+    assert limiter.buckets["rpm"].capacity == 3
+    assert limiter.buckets["tpd"].capacity == 500
+    assert limiter.buckets["rpd"].capacity == pp.RateLimiter.DEFAULTS["rpd"]
+    out = capsys.readouterr().out
+    assert "bogus=1" in out and "rpd=x" in out
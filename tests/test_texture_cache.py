@@ -0,0 +1,78 @@
+class FakeImage:
+    # Just the PhotoImage bits TextureCache reads
+    def __init__(self, w=10, h=10):
+        self.w, self.h = w, h
+
+    def width(self):
+        return self.w
+
+    def height(self):
+        return self.h
+
+IMG_BYTES = 10 * 10 * 4
+
+def test_get_counts_hits_and_misses(pp):
+    cache = pp.TextureCache(max_bytes=10 * IMG_BYTES)
+    img = FakeImage()
+    assert cache.put("a", img) is img
+    assert cache.get("a") is img
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.total_bytes == IMG_BYTES
+
+def test_evicts_least_recently_used(pp):
+    cache = pp.TextureCache(max_bytes=2 * IMG_BYTES)
+    a, b, c = FakeImage(), FakeImage(), FakeImage()
+    cache.put("a", a)
+    cache.put("b", b)
+    cache.get("a") # b is now the oldest
+    cache.put("c", c)
+    assert "b" not in cache
+    assert cache.get("a") is a and cache.get("c") is c
+    assert cache.evictions == 1
+    assert cache.total_bytes == 2 * IMG_BYTES
+
+def test_pinned_images_are_never_evicted(pp):
+    cache = pp.TextureCache(max_bytes=2 * IMG_BYTES)
+    a = FakeImage()
+    cache.put("a", a)
+    assert cache.pin("a") is a
+    cache.put("b", FakeImage())
+    cache.put("c", FakeImage()) # Over budget: b goes, a is on screen
+    cache.put("d", FakeImage())
+    assert "a" in cache and "d" in cache
+    assert "b" not in cache and "c" not in cache
+
+    cache.unpin("a")
+    cache.put("e", FakeImage())
+    assert "a" not in cache # Oldest and no longer pinned
+
+def test_budget_may_be_exceeded_only_by_pinned_images(pp):
+    cache = pp.TextureCache(max_bytes=IMG_BYTES)
+    for key in "abc":
+        cache.put(key, FakeImage())
+        cache.pin(key)
+    assert cache.total_bytes == 3 * IMG_BYTES
+    for key in "abc": cache.unpin(key)
+    assert cache.total_bytes == IMG_BYTES
+    assert "c" in cache
+
+def test_put_keeps_the_first_image(pp):
+    # Replacing an image would drop the last reference to what canvas items show
+    cache = pp.TextureCache(max_bytes=10 * IMG_BYTES)
+    first, second = FakeImage(), FakeImage()
+    cache.put("k", first)
+    cache.pin("k")
+    assert cache.put("k", second) is first
+    assert cache.get("k") is first
+    assert cache.total_bytes == IMG_BYTES
+    assert cache.entries["k"][2] == 1 # Still pinned
+
+def test_clear_keeps_pinned(pp):
+    cache = pp.TextureCache(max_bytes=10 * IMG_BYTES)
+    cache.put("a", FakeImage())
+    cache.put("b", FakeImage())
+    cache.pin("b")
+    cache.clear()
+    assert "a" not in cache and "b" in cache
+    assert cache.total_bytes == IMG_BYTES
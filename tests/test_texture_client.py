@@ -0,0 +1,121 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100 # Only the client sees it, PIL never does
+
+class Handler(BaseHTTPRequestHandler):
+    # Local stand-in for Pollinations, one behaviour per path
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b"", ctype="image/png", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers: self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = hit = server.hits.get(self.path, 0) + 1
+        if self.path == "/ok":
+            self.reply(200, PNG)
+        elif self.path == "/flaky":
+            self.reply(503) if hit == 1 else self.reply(200, PNG)
+        elif self.path == "/slow-down":
+            self.reply(429, headers=[("Retry-After", "0.3")]) if hit == 1 else self.reply(200, PNG)
+        elif self.path == "/down":
+            self.reply(503)
+        elif self.path == "/missing":
+            self.reply(404, b"not found", "text/plain")
+        elif self.path == "/html":
+            self.reply(200, b"<html>rate limited</html>", "text/html")
+        elif self.path == "/declared-huge":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(64 * 1024 * 1024))
+            self.end_headers()
+        elif self.path == "/chunked":
+            # No Content-Length, and far more than any sprite
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunk = b"x" * 65536
+            try:
+                for _ in range(512): # 32 MB
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+                server.finished = True
+            except OSError:
+                pass # Client hung up, which is the point
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.hits = {}
+    srv.finished = False
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def client(pp, server):
+    return pp.TextureClient(f"http://127.0.0.1:{server.server_address[1]}", retries=2, backoff=0.01)
+
+def test_fetch_returns_body(client):
+    assert client.fetch("/ok") == PNG
+    stats = client.stats()
+    assert stats["ok"] == 1 and stats["bytes"] == len(PNG) and stats["n"] == 1
+
+def test_5xx_is_retried(client, server):
+    assert client.fetch("/flaky") == PNG
+    assert server.hits["/flaky"] == 2
+    assert client.stats()["retried"] == 1
+
+def test_retry_after_is_honoured(client, server):
+    t0 = time.monotonic()
+    assert client.fetch("/slow-down") == PNG
+    assert time.monotonic() - t0 >= 0.3
+    assert server.hits["/slow-down"] == 2
+
+def test_gives_up_after_retries(pp, client, server):
+    with pytest.raises(pp.TextureFetchError) as err:
+        client.fetch("/down")
+    assert err.value.retry
+    assert server.hits["/down"] == 3 # First try + 2 retries
+    assert client.stats()["failed"] == 1
+
+def test_4xx_is_not_retried(pp, client, server):
+    with pytest.raises(pp.TextureFetchError, match="HTTP 404") as err:
+        client.fetch("/missing")
+    assert not err.value.retry
+    assert server.hits["/missing"] == 1
+    assert client.stats()["rejected"] == 1
+
+def test_error_pages_are_not_images(pp, client):
+    with pytest.raises(pp.TextureFetchError, match="text/html"):
+        client.fetch("/html")
+
+def test_declared_size_limit(pp, client):
+    with pytest.raises(pp.TextureFetchError, match="too large"):
+        client.fetch("/declared-huge")
+
+def test_streamed_size_limit(pp, client, server):
+    # No Content-Length to go by: the running count has to stop it
+    client.MAX_BYTES = 256 * 1024
+    with pytest.raises(pp.TextureFetchError, match="too large") as err:
+        client.fetch("/chunked")
+    assert not err.value.retry
+    assert server.hits["/chunked"] == 1
+    assert not server.finished